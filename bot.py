@@ -4,12 +4,21 @@ Production-ready bot with referral system, ad earnings, withdrawals & admin pane
 """
 
 import os
+import re
 import logging
 import asyncio
 import sqlite3
-import datetime
 import uuid
 import json
+import functools
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 from dataclasses import dataclass
@@ -31,6 +40,7 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
+from telegram.error import RetryAfter
 
 # Load environment variables
 load_dotenv()
@@ -41,10 +51,16 @@ class Config:
     
     # Bot settings
     BOT_TOKEN = os.getenv("BOT_TOKEN", "8339289686:AAFEziEnXjpaq9RGNJQVas1vyPEl6jiHORk")
-    ADMIN_IDS = json.loads(os.getenv("ADMIN_IDS", "[633765043,6375918223]"))
+    ADMIN_IDS = frozenset(int(x) for x in json.loads(os.getenv("ADMIN_IDS", "[633765043,6375918223]")))
+    
+    # Webhook (falls back to long polling when WEBHOOK_URL is unset)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # Public HTTPS base URL
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    PORT = int(os.getenv("PORT", "8443"))
     
     # Database
     DB_PATH = os.getenv("DB_PATH", "bot_database.db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # Read-only connections
     
     # Financial settings
     AD_EARNING_RATE = float(os.getenv("AD_EARNING_RATE", "5.0"))  # Per ad
@@ -56,8 +72,14 @@ class Config:
     AD_COOLDOWN_SECONDS = int(os.getenv("AD_COOLDOWN_SECONDS", "60"))
     MAX_ADS_PER_DAY = int(os.getenv("MAX_ADS_PER_DAY", "10"))
     
+    # Broadcast (Telegram allows ~30 messages/second per bot)
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "25"))
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))  # Messages per second
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))
+    
     # Payment methods (Bangladesh)
     PAYMENT_METHODS = ["bKash", "Nagad", "Rocket"]
+    PAYMENT_METHODS_BY_KEY = {method.lower(): method for method in PAYMENT_METHODS}
     
     # Messages (Bangla + English)
     MESSAGES = {
@@ -74,19 +96,404 @@ class Config:
         "daily_limit_reached": "⏳ আজকের আয়ের লিমিট শেষ হয়েছে। আগামীকাল আবার চেষ্টা করুন।"
     }
 
+# ==================== SQL STATEMENTS ====================
+# Kept as shared constants so every call reuses sqlite3's per-connection
+# prepared-statement cache instead of re-parsing the SQL
+_SQL_BEGIN_WRITE = 'BEGIN IMMEDIATE'
+
+_SQL_INSERT_USER = '''
+    INSERT OR IGNORE INTO users (telegram_id, username, referral_code, referred_by)
+    VALUES (?, ?, ?, ?)
+    RETURNING id, username, referral_code, balance, total_earned, 
+              total_withdrawn, substr(joined_date, 1, 10), is_banned
+'''
+
+_SQL_GET_USER_ID = 'SELECT id FROM users WHERE telegram_id = ?'
+
+_SQL_GET_REFERRER = 'SELECT telegram_id FROM users WHERE referral_code = ?'
+
+_SQL_GET_USER = '''
+    SELECT id, username, referral_code, balance, total_earned, 
+           total_withdrawn, substr(joined_date, 1, 10), is_banned
+    FROM users 
+    WHERE telegram_id = ?
+'''
+
+# daily_limits' UNIQUE(user_id, date) index serves the join
+_SQL_GET_USER_WITH_TODAY = '''
+    SELECT u.id, u.username, u.referral_code, u.balance, u.total_earned, 
+           u.total_withdrawn, substr(u.joined_date, 1, 10), u.is_banned,
+           COALESCE(dl.earned_today, 0)
+    FROM users u 
+    LEFT JOIN daily_limits dl 
+        ON dl.user_id = u.id AND dl.date = date('now', 'localtime')
+    WHERE u.telegram_id = ?
+'''
+
+_SQL_GET_USER_STATUS = 'SELECT is_banned FROM users WHERE telegram_id = ?'
+
+_SQL_CREDIT_ACTIVE_USER = '''
+    UPDATE users 
+    SET balance = balance + ?, total_earned = total_earned + ?
+    WHERE telegram_id = ? AND is_banned = 0
+'''
+
+_SQL_CREDIT_USER = '''
+    UPDATE users 
+    SET balance = balance + ?, total_earned = total_earned + ?
+    WHERE telegram_id = ?
+'''
+
+_SQL_INSERT_REFERRAL_EARNING = '''
+    INSERT INTO earnings (user_id, amount, type, description)
+    VALUES (?, ?, 'referral', ?)
+'''
+
+_SQL_REFERRAL_STATS = '''
+    SELECT
+        (SELECT COUNT(*) FROM users WHERE referred_by = :user_id),
+        (SELECT COUNT(DISTINCT u.id)
+         FROM users u
+         JOIN earnings e ON u.id = e.user_id
+         WHERE u.referred_by = :user_id),
+        (SELECT COALESCE(SUM(amount), 0)
+         FROM earnings
+         WHERE user_id = :user_id AND type = 'referral')
+'''
+
+_SQL_GET_DAILY_LIMIT = '''
+    SELECT ads_watched, earned_today 
+    FROM daily_limits 
+    WHERE user_id = ? AND date = date('now', 'localtime')
+'''
+
+_SQL_RECENT_AD_WATCH = '''
+    SELECT 1 
+    FROM user_ads 
+    WHERE user_id = ? AND watched_at > datetime('now', ?)
+    LIMIT 1
+'''
+
+_SQL_UPSERT_DAILY_LIMIT = '''
+    INSERT INTO daily_limits (user_id, date, ads_watched, earned_today)
+    VALUES (?, date('now', 'localtime'), 1, ?)
+    ON CONFLICT(user_id, date) 
+    DO UPDATE SET 
+        ads_watched = ads_watched + 1,
+        earned_today = earned_today + ?
+'''
+
+_SQL_INSERT_USER_AD = '''
+    INSERT INTO user_ads (user_id, ad_id)
+    VALUES (?, ?)
+'''
+
+_SQL_INSERT_AD_EARNING = '''
+    INSERT INTO earnings (user_id, amount, type, description)
+    VALUES (?, ?, 'ad', 'Ad watch')
+'''
+
+_SQL_GET_ACTIVE_ADS = 'SELECT id, title, description, earnings, is_active FROM ads WHERE is_active = 1'
+
+_SQL_GET_RANDOM_AD = '''
+    SELECT id, title, description, earnings 
+    FROM ads 
+    WHERE is_active = 1 
+    ORDER BY RANDOM() 
+    LIMIT 1
+'''
+
+_SQL_INSERT_AD = 'INSERT INTO ads (title, description, earnings) VALUES (?, ?, ?)'
+
+_SQL_DEBIT_USER = '''
+    UPDATE users 
+    SET balance = balance - ?
+    WHERE telegram_id = ? AND balance >= ?
+'''
+
+_SQL_INSERT_WITHDRAWAL = '''
+    INSERT INTO withdrawals (user_id, amount, method, mobile_number)
+    VALUES (?, ?, ?, ?)
+'''
+
+_SQL_GET_WITHDRAWALS_BY_STATUS = '''
+    SELECT w.id, w.amount, w.method, w.mobile_number, w.status, 
+           substr(w.requested_at, 1, 16) AS requested_short, u.telegram_id, u.username 
+    FROM withdrawals w
+    JOIN users u ON w.user_id = u.id
+    WHERE w.status = ?
+    ORDER BY w.requested_at DESC
+    LIMIT ?
+'''
+
+_SQL_GET_WITHDRAWALS = '''
+    SELECT w.id, w.amount, w.method, w.mobile_number, w.status, 
+           substr(w.requested_at, 1, 16) AS requested_short, u.telegram_id, u.username 
+    FROM withdrawals w
+    JOIN users u ON w.user_id = u.id
+    ORDER BY w.requested_at DESC
+    LIMIT ?
+'''
+
+_SQL_UPDATE_WITHDRAWAL_STATUS = '''
+    UPDATE withdrawals 
+    SET status = ?, transaction_id = ?, processed_at = CURRENT_TIMESTAMP
+    WHERE id = ? AND status = 'pending'
+'''
+
+# Filled with one "?" per ID before running
+_SQL_APPROVE_PENDING_WITHDRAWALS = '''
+    UPDATE withdrawals 
+    SET status = 'approved', processed_at = CURRENT_TIMESTAMP
+    WHERE status = 'pending' AND id IN ({placeholders})
+'''
+
+_SQL_REFUND_WITHDRAWAL = '''
+    UPDATE users 
+    SET balance = balance + (
+        SELECT amount FROM withdrawals WHERE id = ?
+    )
+    WHERE id = (SELECT user_id FROM withdrawals WHERE id = ?)
+    RETURNING telegram_id
+'''
+
+_SQL_GET_RECENT_USERS = '''
+    SELECT telegram_id, username, balance, is_banned 
+    FROM users 
+    ORDER BY joined_date DESC 
+    LIMIT ?
+'''
+
+_SQL_GET_USER_IDS_AFTER = '''
+    SELECT telegram_id 
+    FROM users 
+    WHERE telegram_id > ? 
+    ORDER BY telegram_id 
+    LIMIT ?
+'''
+
+_SQL_COUNT_USERS = 'SELECT COUNT(*) FROM users'
+
+_SQL_SYSTEM_STATS = '''
+    SELECT
+        (SELECT COUNT(*) FROM users),
+        (SELECT COUNT(DISTINCT user_id) FROM daily_limits WHERE date = date('now', 'localtime')),
+        (SELECT COALESCE(SUM(total_earned), 0) FROM users),
+        (SELECT COALESCE(SUM(amount), 0) FROM withdrawals WHERE status = 'approved'),
+        (SELECT COALESCE(SUM(amount), 0) FROM withdrawals WHERE status = 'pending')
+'''
+
+_SQL_UPSERT_SETTING = '''
+    INSERT OR REPLACE INTO settings (key, value)
+    VALUES (?, ?)
+'''
+
 # ==================== DATABASE MODELS ====================
+def retry_locked(tries: int = 5, base: float = 0.01):
+    """Retry a write with exponential backoff while SQLite reports the database locked/busy"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(tries):
+                try:
+                    return fn(*args, **kwargs)
+                except sqlite3.OperationalError as e:
+                    message = str(e).lower()
+                    if attempt == tries - 1 or ("locked" not in message and "busy" not in message):
+                        raise
+                    time.sleep(base * 2 ** attempt + random.uniform(0, base))
+        return wrapper
+    return decorator
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ttl seconds after being set"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on every pop, so a reader can tell an invalidation raced its fetch
+        self.generation = 0
+    
+    def get(self, key, default=None):
+        """Return a live entry, dropping it if it has expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        """Store an entry, evicting the least recently used one when full"""
+        with self._lock:
+            self._store(key, value)
+    
+    def set_if_unchanged(self, key, value, generation: int):
+        """Store an entry only if nothing was popped since generation was read"""
+        with self._lock:
+            if self.generation == generation:
+                self._store(key, value)
+    
+    def _store(self, key, value):
+        """Insert an entry; the caller holds the lock"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key):
+        """Drop an entry if present"""
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+def memoize(ttl: float, maxsize: int = 16):
+    """Cache a Database method's result for ttl seconds, keyed on its args and the cache version"""
+    def decorator(fn):
+        cache = TTLCache(maxsize, ttl)
+        lock = threading.Lock()
+        
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            key = (id(self), self._cache_version, args, tuple(sorted(kwargs.items())))
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                # Only one thread recomputes; the others wait and reuse its result
+                with lock:
+                    value = cache.get(key, _MISSING)
+                    if value is _MISSING:
+                        value = fn(self, *args, **kwargs)
+                        cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+@dataclass(slots=True)
+class UserView:
+    """User columns the handlers actually read"""
+    id: int
+    username: Optional[str]
+    referral_code: str
+    balance: float
+    total_earned: float
+    total_withdrawn: float
+    joined_date: str  # YYYY-MM-DD, trimmed in SQL
+    is_banned: int
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection that keeps one reusable cursor per SQL statement"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursors: Dict[str, sqlite3.Cursor] = {}
+
+class ConnectionPool:
+    """Thread-safe pool of persistent SQLite connections"""
+    
+    def __init__(self, factory, min_size: int = 2, max_size: int = 4):
+        self._factory = factory
+        self._max_size = max(min_size, max_size)
+        self._idle = queue.LifoQueue()
+        self._size = 0
+        self._lock = threading.Lock()
+        
+        for _ in range(min_size):
+            self._reserve()
+            self._idle.put(self._open())
+    
+    def _reserve(self) -> bool:
+        """Claim a slot for a new connection if the pool may still grow"""
+        with self._lock:
+            if self._size >= self._max_size:
+                return False
+            self._size += 1
+            return True
+    
+    def _open(self) -> sqlite3.Connection:
+        """Open a connection for a previously reserved slot"""
+        try:
+            return self._factory()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, growing the pool up to max_size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        if self._reserve():
+            return self._open()
+        
+        return self._idle.get()
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            # Never hand an open transaction to the next borrower
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+    
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._size -= 1
+
 class Database:
     """Database manager for the bot"""
     
     def __init__(self, db_path: str = Config.DB_PATH):
         self.db_path = db_path
+        self._settings_cache: Dict[str, str] = {}
+        # Bumped whenever memoized aggregates go stale
+        self._cache_version = 0
+        self._uid_cache: Dict[int, int] = {}
+        # Short-lived copies of user rows, dropped on every balance change
+        self._user_cache = TTLCache(maxsize=10000, ttl=30)
         self.init_database()
+        # SQLite serializes writers anyway, so a single write connection is
+        # enough; under WAL the read-only pool never blocks on it
+        self.pool = ConnectionPool(self.get_connection, min_size=1, max_size=1)
+        self.ro_pool = ConnectionPool(
+            self.get_ro_connection,
+            min_size=min(2, Config.DB_POOL_SIZE),
+            max_size=Config.DB_POOL_SIZE
+        )
+        # Referral codes are never reassigned, so lookups can be memoized
+        self._resolve_ref = functools.lru_cache(maxsize=4096)(self._fetch_referrer)
     
     def init_database(self):
         """Initialize database with all tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
+        # WAL is persisted in the database file, so it only has to be set once
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -179,6 +586,16 @@ class Database:
             )
         ''')
         
+        # Indexes
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_ads_user_time ON user_ads(user_id, watched_at DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_referred_by ON users(referred_by)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_earnings_user_type ON earnings(user_id, type)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_status_time ON withdrawals(status, requested_at DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_limits_date ON daily_limits(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_time ON withdrawals(requested_at DESC)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_withdrawals_status_amount ON withdrawals(status, amount)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_joined ON users(joined_date DESC)')
+        
         # Insert default settings if not exists
         default_settings = [
             ('ad_earning_rate', str(Config.AD_EARNING_RATE)),
@@ -189,8 +606,7 @@ class Database:
             ('ad_cooldown', str(Config.AD_COOLDOWN_SECONDS))
         ]
         
-        for key, value in default_settings:
-            cursor.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (key, value))
+        cursor.executemany('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', default_settings)
         
         # Insert sample ads if none exist
         cursor.execute('SELECT COUNT(*) FROM ads')
@@ -200,419 +616,655 @@ class Database:
                 ('🛍️ E-commerce Offer', 'Special discount offer for online shopping', Config.AD_EARNING_RATE),
                 ('🎮 Game Promotion', 'Try this new exciting mobile game', Config.AD_EARNING_RATE)
             ]
-            for title, desc, earnings in sample_ads:
-                cursor.execute('INSERT INTO ads (title, description, earnings) VALUES (?, ?, ?)', 
-                             (title, desc, earnings))
+            cursor.executemany('INSERT INTO ads (title, description, earnings) VALUES (?, ?, ?)', sample_ads)
+        
+        # Refresh planner statistics so the indexes above get picked
+        cursor.execute('ANALYZE')
         
         conn.commit()
+        
+        # Settings only change through update_setting, so keep them in memory
+        cursor.execute('SELECT key, value FROM settings')
+        self._settings_cache = dict(cursor.fetchall())
+        
         conn.close()
     
+    def acquire(self, readonly: bool = False):
+        """Borrow a pooled connection: the single writer, or one of the readers"""
+        return (self.ro_pool if readonly else self.pool).connection()
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
+        self.ro_pool.close()
+    
+    def invalidate_caches(self):
+        """Drop memoized aggregates such as the system stats"""
+        self._cache_version += 1
+    
     def get_connection(self):
         """Get database connection"""
-        return sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, cached_statements=256, factory=PooledConnection
+        )
+        self._configure(conn)
+        return conn
+    
+    def get_ro_connection(self):
+        """Get read-only database connection"""
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(
+            uri, uri=True, check_same_thread=False, cached_statements=256, factory=PooledConnection
+        )
+        # Readers hand back rows the handlers can index by column name
+        conn.row_factory = sqlite3.Row
+        self._configure(conn)
+        return conn
+    
+    @staticmethod
+    def _configure(conn: sqlite3.Connection):
+        """Apply per-connection PRAGMAs"""
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-64000')
+        conn.execute('PRAGMA busy_timeout=5000')
+    
+    @staticmethod
+    def _exec(conn: PooledConnection, sql: str, params=()) -> sqlite3.Cursor:
+        """Execute on the connection's cached cursor for this statement"""
+        cursor = conn.cursors.get(sql)
+        if cursor is None:
+            cursor = conn.cursors[sql] = conn.cursor()
+        return cursor.execute(sql, params)
     
     # User operations
-    def register_user(self, telegram_id: int, username: str, referred_by: int = None) -> bool:
-        """Register a new user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+    @retry_locked()
+    def register_user(self, telegram_id: int, username: str, referred_by: int = None) -> Optional[UserView]:
+        """Register a new user, returning None if they already exist"""
         # Generate unique referral code
         referral_code = f"REF{telegram_id}{uuid.uuid4().hex[:6].upper()}"
         
-        try:
-            cursor.execute('''
-                INSERT INTO users (telegram_id, username, referral_code, referred_by)
-                VALUES (?, ?, ?, ?)
-            ''', (telegram_id, username, referral_code, referred_by))
+        with self.acquire() as conn:
+            self._exec(conn, _SQL_BEGIN_WRITE)
+            cursor = self._exec(conn, _SQL_INSERT_USER, (telegram_id, username, referral_code, referred_by))
+            row = cursor.fetchone()
+            
+            # OR IGNORE returns no row when the user already exists
+            if not row:
+                return None
             
-            # If referred by someone, give referral bonus
+            # If referred by someone, give referral bonus in the same transaction
             if referred_by:
-                self.add_referral_earning(referred_by, telegram_id)
+                self._credit_referral(conn, referred_by, telegram_id)
             
             conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
-        finally:
-            conn.close()
+        
+        user = UserView(*row)
+        self._uid_cache[telegram_id] = user.id
+        self._user_cache.set(telegram_id, user)
+        if referred_by:
+            self._user_cache.pop(referred_by)
+        self.invalidate_caches()
+        return user
     
-    def get_user(self, telegram_id: int) -> Optional[Dict]:
-        """Get user by Telegram ID"""
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def _uid(self, telegram_id: int, conn: sqlite3.Connection) -> Optional[int]:
+        """Map a Telegram ID to the internal user ID, memoizing hits"""
+        user_id = self._uid_cache.get(telegram_id)
+        if user_id is None:
+            cursor = self._exec(conn, _SQL_GET_USER_ID, (telegram_id,))
+            row = cursor.fetchone()
+            if row:
+                user_id = self._uid_cache[telegram_id] = row[0]
+        return user_id
+    
+    def resolve_referral(self, referral_code: str) -> Optional[int]:
+        """Resolve a referral code to the referrer's Telegram ID"""
+        return self._resolve_ref(referral_code)
+    
+    def _fetch_referrer(self, referral_code: str) -> Optional[int]:
+        """Look up the owner of a referral code"""
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_REFERRER, (referral_code,))
+            result = cursor.fetchone()
         
-        cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
-        row = cursor.fetchone()
-        conn.close()
+        return result[0] if result else None
+    
+    def get_user(self, telegram_id: int) -> Optional[UserView]:
+        """Get user by Telegram ID"""
+        user = self._user_cache.get(telegram_id)
+        if user is not None:
+            return user
+        
+        # A write popping the entry mid-fetch means this row may already be stale
+        generation = self._user_cache.generation
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_USER, (telegram_id,))
+            row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        user = UserView(*row)
+        self._user_cache.set_if_unchanged(telegram_id, user, generation)
+        return user
+    
+    def get_user_with_today(self, telegram_id: int) -> Optional[Tuple[UserView, float]]:
+        """Get user by Telegram ID together with today's earnings"""
+        generation = self._user_cache.generation
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_USER_WITH_TODAY, (telegram_id,))
+            row = cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        user = UserView(*row[:-1])
+        self._user_cache.set_if_unchanged(telegram_id, user, generation)
+        return user, row[-1]
+    
+    def check_user_status(self, telegram_id: int) -> Tuple[bool, bool]:
+        """Return (exists, is_banned) for a Telegram ID"""
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_USER_STATUS, (telegram_id,))
+            row = cursor.fetchone()
         
-        return dict(row) if row else None
+        return (True, bool(row[0])) if row else (False, False)
     
     def update_balance(self, telegram_id: int, amount: float) -> bool:
         """Update user balance"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                UPDATE users 
-                SET balance = balance + ?, total_earned = total_earned + ?
-                WHERE telegram_id = ? AND is_banned = 0
-            ''', (amount, amount, telegram_id))
+        with self.acquire() as conn:
+            cursor = self._exec(conn, _SQL_CREDIT_ACTIVE_USER, (amount, amount, telegram_id))
+            updated = cursor.rowcount > 0
             
             conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
+        
+        self._user_cache.pop(telegram_id)
+        return updated
     
     # Referral operations
-    def add_referral_earning(self, referrer_id: int, referred_id: int):
-        """Add referral earnings to referrer"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+    def _credit_referral(self, conn: sqlite3.Connection, referrer_id: int, referred_id: int):
+        """Credit the referral bonus inside the caller's transaction"""
         # Get referral bonus amount
-        cursor.execute('SELECT value FROM settings WHERE key = "referral_bonus"')
-        bonus = float(cursor.fetchone()[0])
+        bonus = float(self._settings_cache['referral_bonus'])
         
         # Add to referrer's balance
-        cursor.execute('''
-            UPDATE users 
-            SET balance = balance + ?, total_earned = total_earned + ?
-            WHERE telegram_id = ?
-        ''', (bonus, bonus, referrer_id))
+        self._exec(conn, _SQL_CREDIT_USER, (bonus, bonus, referrer_id))
         
         # Record the earning
-        cursor.execute('''
-            INSERT INTO earnings (user_id, amount, type, description)
-            VALUES ((SELECT id FROM users WHERE telegram_id = ?), ?, 'referral', ?)
-        ''', (referrer_id, bonus, f"Referral: {referred_id}"))
-        
-        conn.commit()
-        conn.close()
+        self._exec(conn, _SQL_INSERT_REFERRAL_EARNING, (self._uid(referrer_id, conn), bonus, f"Referral: {referred_id}"))
     
     def get_referral_stats(self, telegram_id: int) -> Dict:
         """Get referral statistics for user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Get user ID first
-        cursor.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,))
-        user = cursor.fetchone()
-        
-        if not user:
-            return {"total": 0, "active": 0, "earnings": 0}
-        
-        user_id = user[0]
-        
-        # Count total referrals
-        cursor.execute('SELECT COUNT(*) FROM users WHERE referred_by = ?', (user_id,))
-        total = cursor.fetchone()[0]
-        
-        # Count active referrals (users who have earned something)
-        cursor.execute('''
-            SELECT COUNT(DISTINCT u.id) 
-            FROM users u
-            JOIN earnings e ON u.id = e.user_id
-            WHERE u.referred_by = ?
-        ''', (user_id,))
-        active = cursor.fetchone()[0]
-        
-        # Calculate referral earnings
-        cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0)
-            FROM earnings 
-            WHERE user_id = ? AND type = 'referral'
-        ''', (user_id,))
-        earnings = cursor.fetchone()[0] or 0
-        
-        conn.close()
+        with self.acquire(readonly=True) as conn:
+            user_id = self._uid(telegram_id, conn)
+            if user_id is None:
+                return {"total": 0, "active": 0, "earnings": 0}
+            
+            # Total referrals, active referrals (users who have earned
+            # something) and referral earnings in a single round trip
+            cursor = self._exec(conn, _SQL_REFERRAL_STATS, {"user_id": user_id})
+            total, active, earnings = cursor.fetchone()
         
         return {
             "total": total,
             "active": active,
-            "earnings": earnings
+            "earnings": earnings or 0
         }
     
     # Ad operations
-    def can_watch_ad(self, telegram_id: int) -> Tuple[bool, str]:
-        """Check if user can watch ad"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        today = datetime.date.today().isoformat()
-        
-        # Get user ID
-        cursor.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,))
-        user = cursor.fetchone()
-        
-        if not user:
-            return False, "User not found"
-        
-        user_id = user[0]
-        
+    def _ad_block_reason(self, conn: PooledConnection, user_id: int) -> str:
+        """Return why a user may not watch an ad right now, or an empty string"""
         # Check daily limits
-        cursor.execute('''
-            SELECT ads_watched, earned_today 
-            FROM daily_limits 
-            WHERE user_id = ? AND date = ?
-        ''', (user_id, today))
+        cursor = self._exec(conn, _SQL_GET_DAILY_LIMIT, (user_id,))
         
         limit = cursor.fetchone()
         
-        # Get settings
-        cursor.execute('SELECT key, value FROM settings WHERE key IN ("max_ads_per_day", "daily_earning_limit")')
-        settings = {row[0]: float(row[1]) for row in cursor.fetchall()}
-        
         if limit:
             ads_watched, earned_today = limit
-            if ads_watched >= settings['max_ads_per_day']:
-                return False, "Daily ad limit reached"
-            if earned_today >= settings['daily_earning_limit']:
-                return False, "Daily earning limit reached"
+            if ads_watched >= float(self._settings_cache['max_ads_per_day']):
+                return "Daily ad limit reached"
+            if earned_today >= float(self._settings_cache['daily_earning_limit']):
+                return "Daily earning limit reached"
         
         # Check cooldown
-        cursor.execute('''
-            SELECT MAX(watched_at) 
-            FROM user_ads ua
-            JOIN ads a ON ua.ad_id = a.id
-            WHERE ua.user_id = ?
-        ''', (user_id,))
-        
-        last_watched = cursor.fetchone()[0]
-        if last_watched:
-            last_time = datetime.datetime.fromisoformat(last_watched)
-            cooldown = datetime.timedelta(seconds=Config.AD_COOLDOWN_SECONDS)
-            if datetime.datetime.now() - last_time < cooldown:
-                return False, f"Wait {Config.AD_COOLDOWN_SECONDS} seconds between ads"
-        
-        conn.close()
-        return True, ""
-    
-    def record_ad_watch(self, telegram_id: int, ad_id: int, amount: float):
-        """Record ad watch and update earnings"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        today = datetime.date.today().isoformat()
+        cursor = self._exec(conn, _SQL_RECENT_AD_WATCH, (user_id, f'-{Config.AD_COOLDOWN_SECONDS} seconds'))
         
-        # Get user ID
-        cursor.execute('SELECT id FROM users WHERE telegram_id = ?', (telegram_id,))
-        user_id = cursor.fetchone()[0]
-        
-        # Update daily limits
-        cursor.execute('''
-            INSERT INTO daily_limits (user_id, date, ads_watched, earned_today)
-            VALUES (?, ?, 1, ?)
-            ON CONFLICT(user_id, date) 
-            DO UPDATE SET 
-                ads_watched = ads_watched + 1,
-                earned_today = earned_today + ?
-        ''', (user_id, today, amount, amount))
-        
-        # Record ad watch
-        cursor.execute('''
-            INSERT INTO user_ads (user_id, ad_id)
-            VALUES (?, ?)
-        ''', (user_id, ad_id))
+        if cursor.fetchone():
+            return f"Wait {Config.AD_COOLDOWN_SECONDS} seconds between ads"
         
-        # Update user balance
-        cursor.execute('''
-            UPDATE users 
-            SET balance = balance + ?, total_earned = total_earned + ?
-            WHERE telegram_id = ?
-        ''', (amount, amount, telegram_id))
+        return ""
+    
+    def can_watch_ad(self, telegram_id: int) -> Tuple[bool, str]:
+        """Check if user can watch ad"""
+        with self.acquire(readonly=True) as conn:
+            # Get user ID
+            user_id = self._uid(telegram_id, conn)
+            
+            if user_id is None:
+                return False, "User not found"
+            
+            reason = self._ad_block_reason(conn, user_id)
         
-        # Record earning
-        cursor.execute('''
-            INSERT INTO earnings (user_id, amount, type, description)
-            VALUES (?, ?, 'ad', 'Ad watch')
-        ''', (user_id, amount))
+        return not reason, reason
+    
+    @retry_locked()
+    def record_ad_watch(self, telegram_id: int, ad_id: int, amount: float) -> Tuple[bool, str]:
+        """Record ad watch and update earnings, re-checking the limits under the write lock"""
+        with self.acquire() as conn:
+            # All four writes share one transaction (and one WAL commit)
+            self._exec(conn, _SQL_BEGIN_WRITE)
+            
+            # Get user ID
+            user_id = self._uid(telegram_id, conn)
+            
+            if user_id is None:
+                return False, "User not found"
+            
+            # can_watch_ad ran on a reader, so a concurrent tap may have used up the limit since
+            reason = self._ad_block_reason(conn, user_id)
+            if reason:
+                return False, reason
+            
+            # Update daily limits
+            self._exec(conn, _SQL_UPSERT_DAILY_LIMIT, (user_id, amount, amount))
+            
+            # Record ad watch
+            self._exec(conn, _SQL_INSERT_USER_AD, (user_id, ad_id))
+            
+            # Update user balance
+            self._exec(conn, _SQL_CREDIT_USER, (amount, amount, telegram_id))
+            
+            # Record earning
+            self._exec(conn, _SQL_INSERT_AD_EARNING, (user_id, amount))
+            
+            conn.commit()
         
-        conn.commit()
-        conn.close()
+        self._user_cache.pop(telegram_id)
+        return True, ""
     
-    def get_available_ads(self) -> List[Dict]:
+    def get_available_ads(self) -> List[sqlite3.Row]:
         """Get list of available ads"""
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM ads WHERE is_active = 1')
-        ads = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return ads
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_ACTIVE_ADS)
+            return cursor.fetchall()
+    
+    def get_random_active_ad(self) -> Optional[sqlite3.Row]:
+        """Pick one active ad at random"""
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_RANDOM_AD)
+            return cursor.fetchone()
+    
+    def add_ad(self, title: str, description: str, earnings: float):
+        """Add a new ad"""
+        with self.acquire() as conn:
+            self._exec(conn, _SQL_INSERT_AD, (title, description, earnings))
+            conn.commit()
     
     # Withdrawal operations
+    @retry_locked()
     def create_withdrawal(self, telegram_id: int, amount: float, method: str, mobile: str) -> bool:
         """Create withdrawal request"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         # Check minimum withdrawal
-        cursor.execute('SELECT value FROM settings WHERE key = "minimum_withdrawal"')
-        min_withdrawal = float(cursor.fetchone()[0])
+        min_withdrawal = float(self._settings_cache['minimum_withdrawal'])
         
         if amount < min_withdrawal:
             return False
         
-        # Check balance
-        cursor.execute('SELECT balance FROM users WHERE telegram_id = ?', (telegram_id,))
-        balance = cursor.fetchone()[0]
-        
-        if amount > balance:
-            return False
-        
-        # Deduct from balance
-        cursor.execute('''
-            UPDATE users 
-            SET balance = balance - ?
-            WHERE telegram_id = ?
-        ''', (amount, telegram_id))
-        
-        # Create withdrawal record
-        cursor.execute('''
-            INSERT INTO withdrawals (user_id, amount, method, mobile_number)
-            VALUES ((SELECT id FROM users WHERE telegram_id = ?), ?, ?, ?)
-        ''', (telegram_id, amount, method, mobile))
+        with self.acquire() as conn:
+            self._exec(conn, _SQL_BEGIN_WRITE)
+            
+            # Deduct from balance, only if it covers the amount
+            cursor = self._exec(conn, _SQL_DEBIT_USER, (amount, telegram_id, amount))
+            
+            if cursor.rowcount == 0:
+                return False
+            
+            # Create withdrawal record
+            self._exec(conn, _SQL_INSERT_WITHDRAWAL, (self._uid(telegram_id, conn), amount, method, mobile))
+            
+            conn.commit()
         
-        conn.commit()
-        conn.close()
+        self._user_cache.pop(telegram_id)
+        self.invalidate_caches()
         return True
     
-    def get_withdrawals(self, status: str = None) -> List[Dict]:
-        """Get withdrawals, optionally filtered by status"""
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def get_withdrawals(self, status: str = None, limit: int = -1) -> List[sqlite3.Row]:
+        """Get the newest withdrawals, optionally filtered by status (limit -1 means all)"""
+        with self.acquire(readonly=True) as conn:
+            if status:
+                cursor = self._exec(conn, _SQL_GET_WITHDRAWALS_BY_STATUS, (status, limit))
+            else:
+                cursor = self._exec(conn, _SQL_GET_WITHDRAWALS, (limit,))
+            
+            return cursor.fetchall()
+    
+    @retry_locked()
+    def update_withdrawal_status(self, withdrawal_id: int, status: str, transaction_id: str = None) -> bool:
+        """Settle a pending withdrawal, returning False if it was already processed"""
+        with self.acquire() as conn:
+            self._exec(conn, _SQL_BEGIN_WRITE)
+            cursor = self._exec(conn, _SQL_UPDATE_WITHDRAWAL_STATUS, (status, transaction_id, withdrawal_id))
+            
+            # Only a still-pending request may change state (and be refunded)
+            if cursor.rowcount != 1:
+                return False
+            
+            # If rejected, return money to user
+            refunded = None
+            if status == 'rejected':
+                cursor = self._exec(conn, _SQL_REFUND_WITHDRAWAL, (withdrawal_id, withdrawal_id))
+                refunded = cursor.fetchone()
+            
+            conn.commit()
         
-        if status:
-            cursor.execute('''
-                SELECT w.*, u.telegram_id, u.username 
-                FROM withdrawals w
-                JOIN users u ON w.user_id = u.id
-                WHERE w.status = ?
-                ORDER BY w.requested_at DESC
-            ''', (status,))
-        else:
-            cursor.execute('''
-                SELECT w.*, u.telegram_id, u.username 
-                FROM withdrawals w
-                JOIN users u ON w.user_id = u.id
-                ORDER BY w.requested_at DESC
-            ''')
-        
-        withdrawals = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        if refunded:
+            self._user_cache.pop(refunded[0])
         
-        return withdrawals
+        self.invalidate_caches()
+        return True
     
-    def update_withdrawal_status(self, withdrawal_id: int, status: str, transaction_id: str = None):
-        """Update withdrawal status"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE withdrawals 
-            SET status = ?, transaction_id = ?, processed_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (status, transaction_id, withdrawal_id))
-        
-        # If rejected, return money to user
-        if status == 'rejected':
-            cursor.execute('''
-                UPDATE users 
-                SET balance = balance + (
-                    SELECT amount FROM withdrawals WHERE id = ?
-                )
-                WHERE id = (SELECT user_id FROM withdrawals WHERE id = ?)
-            ''', (withdrawal_id, withdrawal_id))
+    @retry_locked()
+    def approve_pending_withdrawals(self, withdrawal_ids: List[int]) -> int:
+        """Approve the given withdrawals that are still pending in one transaction"""
+        if not withdrawal_ids:
+            return 0
+        
+        sql = _SQL_APPROVE_PENDING_WITHDRAWALS.format(placeholders=", ".join("?" * len(withdrawal_ids)))
+        with self.acquire() as conn:
+            cursor = self._exec(conn, sql, tuple(withdrawal_ids))
+            approved = cursor.rowcount
+            
+            conn.commit()
         
-        conn.commit()
-        conn.close()
+        self.invalidate_caches()
+        return approved
     
     # Admin operations
-    def get_all_users(self, limit: int = 100) -> List[Dict]:
+    def get_all_users(self, limit: int = 100) -> List[sqlite3.Row]:
         """Get all users"""
-        conn = self.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM users 
-            ORDER BY joined_date DESC 
-            LIMIT ?
-        ''', (limit,))
-        
-        users = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return users
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_RECENT_USERS, (limit,))
+            
+            return cursor.fetchall()
     
+    def get_user_ids(self, after: int = 0, limit: int = 500) -> List[int]:
+        """Get the next page of Telegram IDs after a given one, in ID order"""
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_GET_USER_IDS_AFTER, (after, limit))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def count_users(self) -> int:
+        """Count registered users"""
+        with self.acquire(readonly=True) as conn:
+            cursor = self._exec(conn, _SQL_COUNT_USERS)
+            return cursor.fetchone()[0]
+    
+    @memoize(ttl=30)
     def get_system_stats(self) -> Dict:
         """Get system statistics"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        stats = {}
-        
-        # Total users
-        cursor.execute('SELECT COUNT(*) FROM users')
-        stats['total_users'] = cursor.fetchone()[0]
-        
-        # Active users today
-        today = datetime.date.today().isoformat()
-        cursor.execute('SELECT COUNT(DISTINCT user_id) FROM daily_limits WHERE date = ?', (today,))
-        stats['active_today'] = cursor.fetchone()[0] or 0
-        
-        # Total earnings
-        cursor.execute('SELECT COALESCE(SUM(total_earned), 0) FROM users')
-        stats['total_earnings'] = cursor.fetchone()[0] or 0
-        
-        # Total withdrawals
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM withdrawals WHERE status = "approved"')
-        stats['total_withdrawals'] = cursor.fetchone()[0] or 0
-        
-        # Pending withdrawals
-        cursor.execute('SELECT COALESCE(SUM(amount), 0) FROM withdrawals WHERE status = "pending"')
-        stats['pending_withdrawals'] = cursor.fetchone()[0] or 0
+        with self.acquire(readonly=True) as conn:
+            return self._read_stats(conn)
+    
+    @memoize(ttl=15)
+    def get_admin_dashboard(self, limit: int = 5) -> Tuple[Dict, List[sqlite3.Row]]:
+        """Get system statistics and the newest withdrawals over one connection"""
+        with self.acquire(readonly=True) as conn:
+            stats = self._read_stats(conn)
+            cursor = self._exec(conn, _SQL_GET_WITHDRAWALS, (limit,))
+            return stats, cursor.fetchall()
+    
+    def _read_stats(self, conn: PooledConnection) -> Dict:
+        """Run the aggregate stats query on a borrowed connection"""
+        row = self._exec(conn, _SQL_SYSTEM_STATS).fetchone()
         
-        conn.close()
-        return stats
+        keys = ('total_users', 'active_today', 'total_earnings', 'total_withdrawals', 'pending_withdrawals')
+        return {key: value or 0 for key, value in zip(keys, row)}
     
     def update_setting(self, key: str, value: str):
         """Update system setting"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO settings (key, value)
-            VALUES (?, ?)
-        ''', (key, value))
+        with self.acquire() as conn:
+            self._exec(conn, _SQL_UPSERT_SETTING, (key, value))
+            
+            conn.commit()
         
-        conn.commit()
-        conn.close()
+        self._settings_cache[key] = value
     
     def get_setting(self, key: str, default: str = None) -> str:
         """Get system setting"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result[0] if result else default
+        return self._settings_cache.get(key, default)
+    
+    def get_settings(self, keys: Tuple[str, ...]) -> Dict[str, str]:
+        """Get several system settings in one lookup, skipping unset keys"""
+        cache = self._settings_cache
+        return {key: cache[key] for key in keys if key in cache}
+
+class AsyncDatabase:
+    """Awaitable facade over Database that runs each query in a worker thread"""
+    
+    # Served from in-process caches, so these stay plain calls
+    IN_MEMORY = frozenset({"get_setting", "get_settings"})
+    
+    def __init__(self, db: Database):
+        self.sync = db
+    
+    def __getattr__(self, name: str):
+        attr = getattr(self.sync, name)
+        if name in self.IN_MEMORY or not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+        
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+    
+    async def iter_user_ids(self, batch_size: int = 500):
+        """Yield every Telegram ID, fetching one keyset page at a time"""
+        after = 0
+        while True:
+            page = await asyncio.to_thread(self.sync.get_user_ids, after, batch_size)
+            if not page:
+                return
+            
+            for telegram_id in page:
+                yield telegram_id
+            after = page[-1]
+
+# ==================== KEYBOARDS ====================
+# Static markups are built once and shared by every handler call
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🎁 Earn Money", callback_data="earn_money"),
+        InlineKeyboardButton("👥 Refer & Earn", callback_data="referral")
+    ],
+    [
+        InlineKeyboardButton("💰 My Account", callback_data="my_account"),
+        InlineKeyboardButton("💸 Withdraw", callback_data="withdraw")
+    ],
+    [
+        InlineKeyboardButton("📞 Support", callback_data="support"),
+        InlineKeyboardButton("🔧 Admin", callback_data="admin_panel")
+    ]
+])
+
+BACK_ONLY = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
+])
+
+EARN_MENU_WITH_AD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📺 Watch Ad", callback_data="watch_ad")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
+])
+
+EARN_MENU_NO_AD = BACK_ONLY
+
+BACK_TO_EARN = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Back", callback_data="earn_money")]
+])
+
+AD_WATCHED_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🎁 Watch Another", callback_data="watch_ad")],
+    [InlineKeyboardButton("⬅️ Back to Menu", callback_data="back_to_menu")]
+])
+
+WITHDRAW_METHODS_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"{method}", callback_data=f"withdraw_{method.lower()}")] for method in Config.PAYMENT_METHODS]
+    + [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]]
+)
+
+ADMIN_PANEL_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("👥 Users", callback_data="admin_users"),
+        InlineKeyboardButton("💸 Withdrawals", callback_data="admin_withdrawals")
+    ],
+    [
+        InlineKeyboardButton("⚙️ Settings", callback_data="admin_settings"),
+        InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast")
+    ],
+    [
+        InlineKeyboardButton("📊 Stats", callback_data="admin_stats"),
+        InlineKeyboardButton("🎬 Manage Ads", callback_data="admin_ads")
+    ],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
+])
+
+ADMIN_BACK_ONLY = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
+])
+
+ADMIN_STATS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Refresh", callback_data="admin_stats")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
+])
+
+# ==================== MESSAGE TEMPLATES ====================
+# Constant parts are joined once; handlers only fill in the variable fields
+REF_MSG = (
+    Config.MESSAGES['referral_link'] + "\n\n"
+    + Config.MESSAGES['referral_stats']
+    + f"\n\nরেফারেল বোনাস: {Config.REFERRAL_BONUS} টাকা প্রতি রেফারেল"
+).format_map
+
+EARN_MSG = (
+    "🎁 **Earn Money**\n\n{status_msg}\n\n"
+    f"প্রতি বিজ্ঞাপনে আয়: {Config.AD_EARNING_RATE} টাকা"
+).format_map
+
+EARN_MSG_READY = EARN_MSG({"status_msg": "✅ আপনি এখন বিজ্ঞাপন দেখতে পারেন"})
+
+SUPPORT_TEXT = """
+📞 **Support & Contact**
+
+For any issues or questions:
+
+📧 Email: support@example.com
+👨‍💻 Admin: @admin_username
+
+📋 Rules:
+1. No fraudulent activities
+2. One account per person
+3. Follow Telegram guidelines
+
+⚠️ Note: Never share your password or OTP with anyone.
+"""
+
+STATUS_EMOJI = {
+    "pending": "⏳",
+    "approved": "✅",
+    "rejected": "❌"
+}
+
+SETTING_KEYS = (
+    'ad_earning_rate', 'referral_bonus', 'minimum_withdrawal',
+    'daily_earning_limit', 'max_ads_per_day', 'ad_cooldown'
+)
+
+INVALID_SETTING_MSG = f"❌ Invalid key. Valid keys: {', '.join(SETTING_KEYS)}"
+
+@functools.lru_cache(maxsize=16)
+def withdraw_minimum_msg(amount: float) -> str:
+    """Render the minimum-withdrawal warning, once per distinct amount"""
+    return Config.MESSAGES["withdraw_minimum"].format(amount=amount)
+
+@functools.lru_cache(maxsize=64)
+def ad_watched_msg(amount: float) -> str:
+    """Render the ad-watched notice, once per distinct payout"""
+    return Config.MESSAGES["ad_watched"].format(amount=amount)
 
 # ==================== BOT HANDLERS ====================
+# Callback data emitted by the pending-withdrawals keyboard
+WITHDRAW_ACTION_RE = re.compile(r"withdraw_action_(approve_all|approve|reject)_(\d+)")
+
+def requires_admin(handler):
+    """Let only admins through, remembering the verdict in context.user_data"""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        is_admin = context.user_data.get("is_admin")
+        if is_admin is None:
+            is_admin = context.user_data["is_admin"] = update.effective_user.id in Config.ADMIN_IDS
+        
+        if not is_admin:
+            if update.callback_query:
+                # Admin callbacks leave answering to this gate, so the spinner must stop here
+                await update.callback_query.answer()
+                await update.callback_query.edit_message_text(
+                    text="⛔ Access Denied",
+                    reply_markup=BACK_ONLY
+                )
+            elif update.message:
+                await update.message.reply_text("⛔ Access Denied")
+            return
+        
+        return await handler(self, update, context, *args, **kwargs)
+    return wrapper
+
+class RateLimiter:
+    """Space out async calls to at most rate per second"""
+    
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def wait(self):
+        """Sleep until the caller's send slot comes up"""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        
+        if delay > 0:
+            await asyncio.sleep(delay)
+
 class TelegramBot:
     """Main Telegram bot handler"""
     
     def __init__(self):
-        self.db = Database()
+        self.db = AsyncDatabase(Database())
         self.application = None
+        self._admin_routes = {
+            "admin_users": self.show_admin_users,
+            "admin_withdrawals": self.show_admin_withdrawals,
+            "admin_settings": self.show_admin_settings,
+            "admin_stats": self.show_admin_stats,
+            "admin_ads": self.show_admin_ads,
+            "admin_broadcast": self.prompt_broadcast,
+            "admin_panel": self.show_admin_panel,
+            "admin_back": self.show_admin_panel
+        }
+    
+    async def _post_init(self, application: Application):
+        """Size the default executor to match the database connection pools"""
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=Config.DB_POOL_SIZE + 1, thread_name_prefix="db")
+        )
+    
+    async def _post_shutdown(self, application: Application):
+        """Release pooled database connections"""
+        await self.db.close()
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
@@ -620,31 +1272,22 @@ class TelegramBot:
         telegram_id = user.id
         username = user.username or user.first_name
         
-        # Extract referral code from deep link
-        referred_by = None
-        if context.args:
-            try:
-                # Extract referrer's Telegram ID from referral code
-                ref_code = context.args[0]
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('SELECT telegram_id FROM users WHERE referral_code = ?', (ref_code,))
-                result = cursor.fetchone()
-                if result:
-                    referred_by = result[0]
-                conn.close()
-            except:
-                pass
-        
         # Register user if not exists
-        user_data = self.db.get_user(telegram_id)
-        if not user_data:
-            self.db.register_user(telegram_id, username, referred_by)
-            user_data = self.db.get_user(telegram_id)
+        exists, is_banned = await self.db.check_user_status(telegram_id)
+        if not exists:
+            # Extract referral code from deep link
+            referred_by = None
+            if context.args:
+                # Extract referrer's Telegram ID from referral code
+                referred_by = await self.db.resolve_referral(context.args[0])
+            
+            # New accounts always start unbanned, even if a concurrent
+            # update registered this user first
+            await self.db.register_user(telegram_id, username, referred_by)
         
         # Send welcome message
         welcome_msg = Config.MESSAGES["welcome"]
-        if user_data['is_banned']:
+        if is_banned:
             await update.message.reply_text("🚫 আপনার অ্যাকাউন্ট বন্ধ করা হয়েছে।\nYour account has been banned.")
             return
         
@@ -653,41 +1296,29 @@ class TelegramBot:
     
     async def show_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show main menu with inline keyboard"""
-        keyboard = [
-            [
-                InlineKeyboardButton("🎁 Earn Money", callback_data="earn_money"),
-                InlineKeyboardButton("👥 Refer & Earn", callback_data="referral")
-            ],
-            [
-                InlineKeyboardButton("💰 My Account", callback_data="my_account"),
-                InlineKeyboardButton("💸 Withdraw", callback_data="withdraw")
-            ],
-            [
-                InlineKeyboardButton("📞 Support", callback_data="support"),
-                InlineKeyboardButton("🔧 Admin", callback_data="admin_panel")
-            ]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         if update.callback_query:
             await update.callback_query.edit_message_text(
                 text=Config.MESSAGES["menu"],
-                reply_markup=reply_markup
+                reply_markup=MAIN_MENU_MARKUP
             )
         else:
             await update.message.reply_text(
                 text=Config.MESSAGES["menu"],
-                reply_markup=reply_markup
+                reply_markup=MAIN_MENU_MARKUP
             )
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries"""
         query = update.callback_query
-        await query.answer()
-        
         data = query.data
         
+        # Admin callbacks answer the query themselves (withdrawal actions with a status toast)
+        if data.startswith(("admin_", "withdraw_action_")):
+            await self.handle_admin_callback(update, context)
+            return
+        
+        await query.answer()
+        
         if data == "earn_money":
             await self.show_earn_menu(update, context)
         elif data == "referral":
@@ -698,38 +1329,32 @@ class TelegramBot:
             await self.show_withdraw_menu(update, context)
         elif data == "support":
             await self.show_support(update, context)
-        elif data == "admin_panel":
-            await self.show_admin_panel(update, context)
         elif data == "watch_ad":
             await self.watch_ad(update, context)
         elif data == "back_to_menu":
             await self.show_main_menu(update, context)
         elif data.startswith("withdraw_"):
-            method = data.split("_")[1]
+            method = Config.PAYMENT_METHODS_BY_KEY.get(data[len("withdraw_"):])
+            if method is None:
+                return
+            
             context.user_data["withdraw_method"] = method
             await query.edit_message_text(
                 text=f"💸 উত্তোলন পদ্ধতি: {method}\n\nমোবাইল নম্বর দিন:\nEnter mobile number:"
             )
-        elif data.startswith("admin_"):
-            await self.handle_admin_callback(update, context)
     
     async def show_earn_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show earn money menu"""
         telegram_id = update.effective_user.id
-        can_watch, reason = self.db.can_watch_ad(telegram_id)
+        can_watch, reason = await self.db.can_watch_ad(telegram_id)
         
-        keyboard = []
         if can_watch:
-            keyboard.append([InlineKeyboardButton("📺 Watch Ad", callback_data="watch_ad")])
-        
-        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        status_msg = "✅ আপনি এখন বিজ্ঞাপন দেখতে পারেন" if can_watch else f"⏳ {reason}"
+            message, reply_markup = EARN_MSG_READY, EARN_MENU_WITH_AD
+        else:
+            message, reply_markup = EARN_MSG({"status_msg": f"⏳ {reason}"}), EARN_MENU_NO_AD
         
         await update.callback_query.edit_message_text(
-            text=f"🎁 **Earn Money**\n\n{status_msg}\n\nপ্রতি বিজ্ঞাপনে আয়: {Config.AD_EARNING_RATE} টাকা",
+            text=message,
             reply_markup=reply_markup
         )
     
@@ -738,148 +1363,113 @@ class TelegramBot:
         telegram_id = update.effective_user.id
         
         # Check if can watch ad
-        can_watch, reason = self.db.can_watch_ad(telegram_id)
+        can_watch, reason = await self.db.can_watch_ad(telegram_id)
         if not can_watch:
             await update.callback_query.edit_message_text(
                 text=f"⏳ {reason}\n\n⬅️ Back to menu",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="earn_money")]
-                ])
+                reply_markup=BACK_TO_EARN
             )
             return
         
-        # Get available ads
-        ads = self.db.get_available_ads()
-        if not ads:
+        # Select random ad
+        ad = await self.db.get_random_active_ad()
+        if not ad:
             await update.callback_query.edit_message_text(
                 text="📭 কোন বিজ্ঞাপন নেই\nNo ads available",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="earn_money")]
-                ])
+                reply_markup=BACK_TO_EARN
             )
             return
         
-        # Select random ad
-        import random
-        ad = random.choice(ads)
-        
-        # Record ad watch
-        self.db.record_ad_watch(telegram_id, ad['id'], ad['earnings'])
+        # Record ad watch; only a credited watch counts as a success
+        credited, reason = await self.db.record_ad_watch(telegram_id, ad['id'], ad['earnings'])
+        if not credited:
+            await update.callback_query.edit_message_text(
+                text=f"⏳ {reason}\n\n⬅️ Back to menu",
+                reply_markup=BACK_TO_EARN
+            )
+            return
         
         # Show success message
         await update.callback_query.edit_message_text(
-            text=f"🎬 **{ad['title']}**\n\n{ad['description']}\n\n{Config.MESSAGES['ad_watched'].format(amount=ad['earnings'])}",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🎁 Watch Another", callback_data="watch_ad")],
-                [InlineKeyboardButton("⬅️ Back to Menu", callback_data="back_to_menu")]
-            ])
+            text=f"🎬 **{ad['title']}**\n\n{ad['description']}\n\n{ad_watched_msg(ad['earnings'])}",
+            reply_markup=AD_WATCHED_MARKUP
         )
     
     async def show_referral_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show referral information"""
         telegram_id = update.effective_user.id
-        user = self.db.get_user(telegram_id)
+        user = await self.db.get_user(telegram_id)
         
         if not user:
             await update.callback_query.edit_message_text(
                 text="User not found",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-                ])
+                reply_markup=BACK_ONLY
             )
             return
         
         # Get referral link
         bot_username = context.bot.username
-        ref_link = f"https://t.me/{bot_username}?start={user['referral_code']}"
+        ref_link = f"https://t.me/{bot_username}?start={user.referral_code}"
         
         # Get referral stats
-        stats = self.db.get_referral_stats(telegram_id)
-        
-        message = f"{Config.MESSAGES['referral_link'].format(ref_link=ref_link)}\n\n"
-        message += f"{Config.MESSAGES['referral_stats'].format(**stats)}\n\n"
-        message += f"রেফারেল বোনাস: {Config.REFERRAL_BONUS} টাকা প্রতি রেফারেল"
+        stats = await self.db.get_referral_stats(telegram_id)
         
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-        ]
+        message = REF_MSG({"ref_link": ref_link, **stats})
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=BACK_ONLY
         )
     
     async def show_account_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show account information"""
         telegram_id = update.effective_user.id
-        user = self.db.get_user(telegram_id)
+        result = await self.db.get_user_with_today(telegram_id)
         
-        if not user:
+        if not result:
             await update.callback_query.edit_message_text(
                 text="User not found",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-                ])
+                reply_markup=BACK_ONLY
             )
             return
         
-        # Get today's earnings
-        today = datetime.date.today().isoformat()
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT earned_today FROM daily_limits WHERE user_id = ? AND date = ?', 
-                      (user['id'], today))
-        today_earned = cursor.fetchone()
-        today_earned = today_earned[0] if today_earned else 0
-        conn.close()
+        user, today_earned = result
         
         message = f"👤 **Account Info**\n\n"
-        message += f"Username: @{user['username'] or 'N/A'}\n"
-        message += f"Joined: {user['joined_date'][:10]}\n\n"
-        message += f"💰 Balance: {user['balance']:.2f} টাকা\n"
+        message += f"Username: @{user.username or 'N/A'}\n"
+        message += f"Joined: {user.joined_date}\n\n"
+        message += f"💰 Balance: {user.balance:.2f} টাকা\n"
         message += f"📊 Today's Earnings: {today_earned:.2f} টাকা\n"
-        message += f"🏦 Total Earned: {user['total_earned']:.2f} টাকা\n"
-        message += f"💸 Total Withdrawn: {user['total_withdrawn']:.2f} টাকা"
-        
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-        ]
+        message += f"🏦 Total Earned: {user.total_earned:.2f} টাকা\n"
+        message += f"💸 Total Withdrawn: {user.total_withdrawn:.2f} টাকা"
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=BACK_ONLY
         )
     
     async def show_withdraw_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show withdrawal menu"""
         telegram_id = update.effective_user.id
-        user = self.db.get_user(telegram_id)
+        user = await self.db.get_user(telegram_id)
         
         if not user:
             await update.callback_query.edit_message_text(
                 text="User not found",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-                ])
+                reply_markup=BACK_ONLY
             )
             return
         
         min_withdrawal = float(self.db.get_setting('minimum_withdrawal', Config.MINIMUM_WITHDRAWAL))
         
         message = f"💸 **Withdraw Money**\n\n"
-        message += f"💰 Available Balance: {user['balance']:.2f} টাকা\n"
+        message += f"💰 Available Balance: {user.balance:.2f} টাকা\n"
         message += f"📋 Minimum Withdrawal: {min_withdrawal:.2f} টাকা\n\n"
         message += "পেমেন্ট মেথড নির্বাচন করুন:\nSelect payment method:"
         
-        keyboard = []
-        for method in Config.PAYMENT_METHODS:
-            keyboard.append([InlineKeyboardButton(f"{method}", callback_data=f"withdraw_{method.lower()}")])
-        
-        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")])
-        
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=WITHDRAW_METHODS_MARKUP
         )
     
     async def handle_withdraw_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -910,38 +1500,29 @@ class TelegramBot:
                 
                 if amount < min_withdrawal:
                     await update.message.reply_text(
-                        Config.MESSAGES["withdraw_minimum"].format(amount=min_withdrawal)
+                        withdraw_minimum_msg(min_withdrawal)
                     )
                     return
                 
-                user = self.db.get_user(user_id)
-                if amount > user['balance']:
+                user = await self.db.get_user(user_id)
+                if amount > user.balance:
                     await update.message.reply_text("❌ Insufficient balance")
                     return
                 
                 # Create withdrawal request
-                success = self.db.create_withdrawal(
-                    user_id, amount, method.capitalize(), context.user_data["withdraw_mobile"]
+                success = await self.db.create_withdrawal(
+                    user_id, amount, method, context.user_data["withdraw_mobile"]
                 )
                 
                 if success:
                     await update.message.reply_text(Config.MESSAGES["withdraw_success"])
                     
-                    # Notify admins
-                    stats = self.db.get_system_stats()
-                    for admin_id in Config.ADMIN_IDS:
-                        try:
-                            await context.bot.send_message(
-                                admin_id,
-                                f"🆕 New Withdrawal Request\n\n"
-                                f"User: @{user['username'] or 'N/A'}\n"
-                                f"Amount: {amount} টাকা\n"
-                                f"Method: {method}\n"
-                                f"Mobile: {context.user_data['withdraw_mobile']}\n\n"
-                                f"Total Pending: {stats['pending_withdrawals'] + amount} টাকা"
-                            )
-                        except:
-                            pass
+                    # Notify admins in the background so the user isn't kept waiting
+                    context.application.create_task(
+                        self.notify_new_withdrawal(
+                            context, user.username, amount, method, context.user_data["withdraw_mobile"]
+                        )
+                    )
                 else:
                     await update.message.reply_text("❌ Withdrawal failed")
                 
@@ -952,48 +1533,37 @@ class TelegramBot:
             except ValueError:
                 await update.message.reply_text("❌ Invalid amount. Please enter a number:")
     
+    async def notify_new_withdrawal(self, context: ContextTypes.DEFAULT_TYPE, username: str,
+                                    amount: float, method: str, mobile: str):
+        """Tell every admin about a new withdrawal request"""
+        # Stats are re-read after the insert, so the pending total already includes it
+        stats = await self.db.get_system_stats()
+        notify_text = (
+            f"🆕 New Withdrawal Request\n\n"
+            f"User: @{username or 'N/A'}\n"
+            f"Amount: {amount} টাকা\n"
+            f"Method: {method}\n"
+            f"Mobile: {mobile}\n\n"
+            f"Total Pending: {stats['pending_withdrawals']} টাকা"
+        )
+        
+        await asyncio.gather(
+            *(context.bot.send_message(admin_id, notify_text) for admin_id in Config.ADMIN_IDS),
+            return_exceptions=True
+        )
+    
     async def show_support(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show support information"""
-        support_info = """
-📞 **Support & Contact**
-
-For any issues or questions:
-
-📧 Email: support@example.com
-👨‍💻 Admin: @admin_username
-
-📋 Rules:
-1. No fraudulent activities
-2. One account per person
-3. Follow Telegram guidelines
-
-⚠️ Note: Never share your password or OTP with anyone.
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-        ]
-        
         await update.callback_query.edit_message_text(
-            text=support_info,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            text=SUPPORT_TEXT,
+            reply_markup=BACK_ONLY
         )
     
     # ==================== ADMIN PANEL ====================
+    @requires_admin
     async def show_admin_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show admin panel"""
-        telegram_id = update.effective_user.id
-        
-        if telegram_id not in Config.ADMIN_IDS:
-            await update.callback_query.edit_message_text(
-                text="⛔ Access Denied",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-                ])
-            )
-            return
-        
-        stats = self.db.get_system_stats()
+        stats = await self.db.get_system_stats()
         
         message = f"{Config.MESSAGES['admin_panel']}\n\n"
         message += f"📊 System Stats:\n"
@@ -1004,109 +1574,95 @@ For any issues or questions:
         message += f"• Pending Withdrawals: {stats['pending_withdrawals']:.2f} টাকা\n\n"
         message += "Select option:"
         
-        keyboard = [
-            [
-                InlineKeyboardButton("👥 Users", callback_data="admin_users"),
-                InlineKeyboardButton("💸 Withdrawals", callback_data="admin_withdrawals")
-            ],
-            [
-                InlineKeyboardButton("⚙️ Settings", callback_data="admin_settings"),
-                InlineKeyboardButton("📢 Broadcast", callback_data="admin_broadcast")
-            ],
-            [
-                InlineKeyboardButton("📊 Stats", callback_data="admin_stats"),
-                InlineKeyboardButton("🎬 Manage Ads", callback_data="admin_ads")
-            ],
-            [InlineKeyboardButton("⬅️ Back", callback_data="back_to_menu")]
-        ]
-        
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=ADMIN_PANEL_MARKUP
         )
     
+    @requires_admin
     async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle admin panel callbacks"""
         query = update.callback_query
         data = query.data
         
-        if data == "admin_users":
-            await self.show_admin_users(update, context)
-        elif data == "admin_withdrawals":
-            await self.show_admin_withdrawals(update, context)
-        elif data == "admin_settings":
-            await self.show_admin_settings(update, context)
-        elif data == "admin_stats":
-            await self.show_admin_stats(update, context)
-        elif data == "admin_ads":
-            await self.show_admin_ads(update, context)
-        elif data == "admin_broadcast":
-            await query.edit_message_text(
-                text="📢 Broadcast Message\n\nSend the message you want to broadcast:"
-            )
-            context.user_data["awaiting_broadcast"] = True
-        elif data.startswith("withdraw_action_"):
-            parts = data.split("_")
-            action = parts[2]
-            withdraw_id = int(parts[3])
-            
-            if action == "approve":
-                self.db.update_withdrawal_status(withdraw_id, "approved")
-                await query.answer("Withdrawal approved")
-            elif action == "reject":
-                self.db.update_withdrawal_status(withdraw_id, "rejected")
-                await query.answer("Withdrawal rejected")
-            
-            await self.show_admin_withdrawals(update, context)
-        elif data == "admin_back":
-            await self.show_admin_panel(update, context)
+        handler = self._admin_routes.get(data)
+        if handler:
+            await query.answer()
+            await handler(update, context)
+            return
+        
+        match = WITHDRAW_ACTION_RE.fullmatch(data)
+        if not match:
+            await query.answer()
+            return
+        
+        action, withdraw_id = match.group(1), int(match.group(2))
+        
+        if action == "approve_all":
+            # withdraw_id is the newest request on the list; an older button no longer matches it
+            shown_ids = context.user_data.get("approve_all_ids", [])
+            if shown_ids and max(shown_ids) == withdraw_id:
+                approved = await self.db.approve_pending_withdrawals(shown_ids)
+                await query.answer(f"{approved} withdrawals approved")
+            else:
+                await query.answer("This list is out of date, nothing was approved")
+        else:
+            status = "approved" if action == "approve" else "rejected"
+            if await self.db.update_withdrawal_status(withdraw_id, status):
+                await query.answer(f"Withdrawal {status}")
+            else:
+                await query.answer("Withdrawal was already processed")
+        
+        await self.show_admin_withdrawals(update, context)
+    
+    async def prompt_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask the admin for the broadcast text"""
+        await update.callback_query.edit_message_text(
+            text="📢 Broadcast Message\n\nSend the message you want to broadcast:"
+        )
+        context.user_data["awaiting_broadcast"] = True
     
     async def show_admin_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show admin users list"""
-        users = self.db.get_all_users(limit=20)
+        users = await self.db.get_all_users(limit=10)
+        stats = await self.db.get_system_stats()
         
-        message = "👥 **Users List**\n\n"
-        for i, user in enumerate(users[:10], 1):
+        parts = ["👥 **Users List**\n"]
+        for i, user in enumerate(users, 1):
             status = "🚫" if user['is_banned'] else "✅"
-            message += f"{i}. @{user['username'] or 'N/A'} - {user['balance']:.2f} টাকা {status}\n"
+            parts.append(f"{i}. @{user['username'] or 'N/A'} - {user['balance']:.2f} টাকা {status}")
         
-        if len(users) > 10:
-            message += f"\n... and {len(users) - 10} more users"
+        if stats['total_users'] > len(users):
+            parts.append(f"\n... and {stats['total_users'] - len(users)} more users")
         
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
-        ]
+        message = "\n".join(parts)
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=ADMIN_BACK_ONLY
         )
     
     async def show_admin_withdrawals(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show admin withdrawals list"""
-        withdrawals = self.db.get_withdrawals("pending")
+        withdrawals = await self.db.get_withdrawals("pending", limit=5)
         
         if not withdrawals:
             message = "📭 No pending withdrawals"
-            keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]]
+            markup = ADMIN_BACK_ONLY
         else:
-            message = "💸 **Pending Withdrawals**\n\n"
-            for i, wd in enumerate(withdrawals[:5], 1):
-                status_emoji = {
-                    "pending": "⏳",
-                    "approved": "✅",
-                    "rejected": "❌"
-                }.get(wd['status'], "❓")
-                
-                message += f"{i}. @{wd['username'] or 'N/A'}\n"
-                message += f"   Amount: {wd['amount']:.2f} টাকা\n"
-                message += f"   Method: {wd['method']} ({wd['mobile_number']})\n"
-                message += f"   Date: {wd['requested_at'][:16]}\n"
+            parts = ["💸 **Pending Withdrawals**\n"]
+            for i, wd in enumerate(withdrawals, 1):
+                parts.append(f"{i}. @{wd['username'] or 'N/A'}")
+                parts.append(f"   Amount: {wd['amount']:.2f} টাকা")
+                parts.append(f"   Method: {wd['method']} ({wd['mobile_number']})")
+                parts.append(f"   Date: {wd['requested_short']}")
                 
                 if wd['status'] == 'pending':
-                    message += f"   [Approve] [Reject]\n\n"
+                    parts.append("   [Approve] [Reject]\n")
                 else:
-                    message += f"   Status: {status_emoji} {wd['status']}\n\n"
+                    parts.append(f"   Status: {STATUS_EMOJI.get(wd['status'], '❓')} {wd['status']}\n")
+            
+            message = "\n".join(parts)
             
             keyboard = []
             for wd in withdrawals[:3]:  # Show buttons for first 3
@@ -1116,104 +1672,99 @@ For any issues or questions:
                 ]
                 keyboard.append(row)
             
+            if len(withdrawals) > 1:
+                # Only the requests rendered here get approved, so ones arriving later stay pending
+                shown_ids = [wd['id'] for wd in withdrawals]
+                context.user_data["approve_all_ids"] = shown_ids
+                newest_id = max(shown_ids)
+                keyboard.append([
+                    InlineKeyboardButton("✅ Approve all", callback_data=f"withdraw_action_approve_all_{newest_id}")
+                ])
+            
             keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="admin_back")])
+            markup = InlineKeyboardMarkup(keyboard)
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=markup
         )
     
     async def show_admin_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show admin settings"""
+        values = self.db.get_settings(SETTING_KEYS)
         settings = {
-            "Ad Earning Rate": self.db.get_setting('ad_earning_rate', Config.AD_EARNING_RATE),
-            "Referral Bonus": self.db.get_setting('referral_bonus', Config.REFERRAL_BONUS),
-            "Minimum Withdrawal": self.db.get_setting('minimum_withdrawal', Config.MINIMUM_WITHDRAWAL),
-            "Daily Earning Limit": self.db.get_setting('daily_earning_limit', Config.DAILY_EARNING_LIMIT),
-            "Max Ads Per Day": self.db.get_setting('max_ads_per_day', Config.MAX_ADS_PER_DAY),
-            "Ad Cooldown (seconds)": self.db.get_setting('ad_cooldown', Config.AD_COOLDOWN_SECONDS)
+            "Ad Earning Rate": values.get('ad_earning_rate', Config.AD_EARNING_RATE),
+            "Referral Bonus": values.get('referral_bonus', Config.REFERRAL_BONUS),
+            "Minimum Withdrawal": values.get('minimum_withdrawal', Config.MINIMUM_WITHDRAWAL),
+            "Daily Earning Limit": values.get('daily_earning_limit', Config.DAILY_EARNING_LIMIT),
+            "Max Ads Per Day": values.get('max_ads_per_day', Config.MAX_ADS_PER_DAY),
+            "Ad Cooldown (seconds)": values.get('ad_cooldown', Config.AD_COOLDOWN_SECONDS)
         }
         
-        message = "⚙️ **System Settings**\n\n"
-        for key, value in settings.items():
-            message += f"{key}: {value}\n"
+        parts = ["⚙️ **System Settings**\n"]
+        parts.extend(f"{key}: {value}" for key, value in settings.items())
         
-        message += "\nTo change settings, use command:\n"
-        message += "/set <key> <value>\n"
-        message += "Example: /set ad_earning_rate 10"
+        parts.append("\nTo change settings, use command:")
+        parts.append("/set <key> <value>")
+        parts.append("Example: /set ad_earning_rate 10")
         
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
-        ]
+        message = "\n".join(parts)
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=ADMIN_BACK_ONLY
         )
     
     async def show_admin_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show detailed admin stats"""
-        stats = self.db.get_system_stats()
-        
-        # Get recent withdrawals
-        withdrawals = self.db.get_withdrawals()
-        recent_withdrawals = withdrawals[:5]
-        
-        message = "📊 **Detailed Statistics**\n\n"
-        message += f"👥 Total Users: {stats['total_users']}\n"
-        message += f"📈 Active Today: {stats['active_today']}\n"
-        message += f"💰 Total Earnings: {stats['total_earnings']:.2f} টাকা\n"
-        message += f"💸 Total Withdrawn: {stats['total_withdrawals']:.2f} টাকা\n"
-        message += f"⏳ Pending Withdrawals: {stats['pending_withdrawals']:.2f} টাকা\n\n"
-        
-        message += "📋 Recent Withdrawals:\n"
+        stats, recent_withdrawals = await self.db.get_admin_dashboard()
+        
+        parts = [
+            "📊 **Detailed Statistics**\n",
+            f"👥 Total Users: {stats['total_users']}",
+            f"📈 Active Today: {stats['active_today']}",
+            f"💰 Total Earnings: {stats['total_earnings']:.2f} টাকা",
+            f"💸 Total Withdrawn: {stats['total_withdrawals']:.2f} টাকা",
+            f"⏳ Pending Withdrawals: {stats['pending_withdrawals']:.2f} টাকা\n",
+            "📋 Recent Withdrawals:"
+        ]
         for wd in recent_withdrawals:
-            status_emoji = {"pending": "⏳", "approved": "✅", "rejected": "❌"}.get(wd['status'], "❓")
-            message += f"• {status_emoji} {wd['amount']:.2f} টাকা - @{wd['username'] or 'N/A'}\n"
+            status_emoji = STATUS_EMOJI.get(wd['status'], "❓")
+            parts.append(f"• {status_emoji} {wd['amount']:.2f} টাকা - @{wd['username'] or 'N/A'}")
         
-        keyboard = [
-            [InlineKeyboardButton("🔄 Refresh", callback_data="admin_stats")],
-            [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
-        ]
+        message = "\n".join(parts)
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=ADMIN_STATS_MARKUP
         )
     
     async def show_admin_ads(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show admin ads management"""
-        ads = self.db.get_available_ads()
+        ads = await self.db.get_available_ads()
         
-        message = "🎬 **Manage Ads**\n\n"
+        parts = ["🎬 **Manage Ads**\n"]
         for ad in ads:
             status = "✅ Active" if ad['is_active'] else "❌ Inactive"
-            message += f"📺 {ad['title']}\n"
-            message += f"   {ad['description']}\n"
-            message += f"   Earnings: {ad['earnings']} টাকা\n"
-            message += f"   Status: {status}\n\n"
+            parts.append(f"📺 {ad['title']}")
+            parts.append(f"   {ad['description']}")
+            parts.append(f"   Earnings: {ad['earnings']} টাকা")
+            parts.append(f"   Status: {status}\n")
         
-        message += "To add new ad, use command:\n"
-        message += "/add_ad <title> | <description> | <earnings>\n"
-        message += "Example: /add_ad New Product | Watch this video | 10"
+        parts.append("To add new ad, use command:")
+        parts.append("/add_ad <title> | <description> | <earnings>")
+        parts.append("Example: /add_ad New Product | Watch this video | 10")
         
-        keyboard = [
-            [InlineKeyboardButton("⬅️ Back", callback_data="admin_back")]
-        ]
+        message = "\n".join(parts)
         
         await update.callback_query.edit_message_text(
             text=message,
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=ADMIN_BACK_ONLY
         )
     
+    @requires_admin
     async def handle_admin_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle admin commands"""
-        telegram_id = update.effective_user.id
-        
-        if telegram_id not in Config.ADMIN_IDS:
-            await update.message.reply_text("⛔ Access Denied")
-            return
-        
         text = update.message.text.strip()
         command = text.split()[0].lower()
         
@@ -1221,16 +1772,11 @@ For any issues or questions:
             key = context.args[0]
             value = " ".join(context.args[1:])
             
-            valid_keys = [
-                'ad_earning_rate', 'referral_bonus', 'minimum_withdrawal',
-                'daily_earning_limit', 'max_ads_per_day', 'ad_cooldown'
-            ]
-            
-            if key in valid_keys:
-                self.db.update_setting(key, value)
+            if key in SETTING_KEYS:
+                await self.db.update_setting(key, value)
                 await update.message.reply_text(f"✅ Setting updated: {key} = {value}")
             else:
-                await update.message.reply_text(f"❌ Invalid key. Valid keys: {', '.join(valid_keys)}")
+                await update.message.reply_text(INVALID_SETTING_MSG)
         
         elif command == "/add_ad" and len(context.args) >= 3:
             try:
@@ -1244,12 +1790,7 @@ For any issues or questions:
                 earnings = float(ad_data[2].strip())
                 
                 # Add to database
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('INSERT INTO ads (title, description, earnings) VALUES (?, ?, ?)',
-                             (title, description, earnings))
-                conn.commit()
-                conn.close()
+                await self.db.add_ad(title, description, earnings)
                 
                 await update.message.reply_text(f"✅ Ad added: {title}")
             except:
@@ -1259,44 +1800,75 @@ For any issues or questions:
             message = " ".join(context.args)
             await self.send_broadcast(update, context, message)
     
+    @requires_admin
     async def send_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message: str):
         """Send broadcast message to all users"""
-        telegram_id = update.effective_user.id
-        
-        if telegram_id not in Config.ADMIN_IDS:
-            return
-        
-        users = self.db.get_all_users()
-        total = len(users)
-        success = 0
+        total = await self.db.count_users()
         
         await update.message.reply_text(f"📢 Broadcasting to {total} users...")
         
-        for user in users:
+        # Delivery takes minutes on a large user base, so let the bot keep serving updates meanwhile
+        context.application.create_task(self.deliver_broadcast(update, context, message, total))
+    
+    async def deliver_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                message: str, total: int):
+        """Send the broadcast to every user and report back to the admin"""
+        text = f"📢 **Announcement**\n\n{message}"
+        workers = Config.BROADCAST_CONCURRENCY
+        limiter = RateLimiter(Config.BROADCAST_RATE)
+        # Bounded, so only about one page of IDs is held in memory at a time
+        recipients = asyncio.Queue(maxsize=Config.BROADCAST_BATCH_SIZE)
+        
+        async def deliver(chat_id: int) -> bool:
+            for attempt in range(2):
+                await limiter.wait()
+                try:
+                    await context.bot.send_message(chat_id=chat_id, text=text)
+                    return True
+                except RetryAfter as e:
+                    # Flood control: back off as told, then retry once
+                    if attempt:
+                        return False
+                    await asyncio.sleep(e.retry_after)
+                except Exception:
+                    return False
+            return False
+        
+        async def produce():
             try:
-                await context.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=f"📢 **Announcement**\n\n{message}"
-                )
-                success += 1
-                await asyncio.sleep(0.1)  # Rate limiting
-            except:
-                continue
+                async for chat_id in self.db.iter_user_ids(Config.BROADCAST_BATCH_SIZE):
+                    await recipients.put(chat_id)
+            finally:
+                # One stop marker per worker, even if the scan failed
+                for _ in range(workers):
+                    await recipients.put(None)
+        
+        async def consume() -> int:
+            sent = 0
+            while (chat_id := await recipients.get()) is not None:
+                sent += await deliver(chat_id)
+            return sent
+        
+        _, *sent = await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+        success = sum(sent)
         
         await update.message.reply_text(f"✅ Broadcast sent to {success}/{total} users")
     
+    @requires_admin
     async def handle_broadcast_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle broadcast message from admin"""
-        telegram_id = update.effective_user.id
-        
-        if telegram_id not in Config.ADMIN_IDS:
-            return
-        
         if context.user_data.get("awaiting_broadcast"):
             message = update.message.text
             context.user_data.pop("awaiting_broadcast", None)
             await self.send_broadcast(update, context, message)
     
+    async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Route plain text to whichever conversation the user is in"""
+        if context.user_data.get("awaiting_broadcast"):
+            await self.handle_broadcast_message(update, context)
+        else:
+            await self.handle_withdraw_input(update, context)
+    
     # ==================== SETUP & RUN ====================
     def setup_handlers(self):
         """Setup bot handlers"""
@@ -1312,16 +1884,10 @@ For any issues or questions:
         # Callback query handler
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
         
-        # Message handlers
+        # Text handler (withdrawal input and admin broadcast)
         self.application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND,
-            self.handle_withdraw_input
-        ))
-        
-        # Broadcast message handler
-        self.application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND,
-            self.handle_broadcast_message
+            self.handle_text
         ))
     
     def run(self):
@@ -1332,7 +1898,15 @@ For any issues or questions:
             return
         
         # Create application
-        self.application = Application.builder().token(Config.BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(Config.BOT_TOKEN)
+            # Handle updates in parallel, up to what the read pool can serve at once
+            .concurrent_updates(Config.DB_POOL_SIZE)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
         
         # Setup handlers
         self.setup_handlers()
@@ -1341,7 +1915,18 @@ For any issues or questions:
         print("🤖 Bot is starting...")
         print(f"👑 Admin IDs: {Config.ADMIN_IDS}")
         
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if Config.WEBHOOK_URL:
+            # Telegram pushes updates; TLS is terminated by the platform/reverse proxy
+            self.application.run_webhook(
+                listen="0.0.0.0",
+                port=Config.PORT,
+                url_path=Config.BOT_TOKEN,
+                webhook_url=f"{Config.WEBHOOK_URL}/{Config.BOT_TOKEN}",
+                secret_token=Config.WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            self.application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 # ==================== DEPLOYMENT GUIDE ====================
 """
@@ -1349,17 +1934,23 @@ DEPLOYMENT GUIDE
 
 1. REQUIREMENTS:
    Python 3.8+
-   Required packages: python-telegram-bot, python-dotenv
+   Required packages: python-telegram-bot[webhooks], python-dotenv
 
 2. SETUP INSTRUCTIONS:
 
    a) Install dependencies:
-      pip install python-telegram-bot python-dotenv
+      pip install "python-telegram-bot[webhooks]" python-dotenv
 
    b) Create .env file:
       BOT_TOKEN=your_bot_token_from_botfather
       ADMIN_IDS=[123456789, 987654321]
       DB_PATH=bot_database.db
+      
+      For webhooks (recommended in production), also set:
+      WEBHOOK_URL=https://your-domain.example
+      WEBHOOK_SECRET=random_secret_string
+      PORT=8443
+      Without WEBHOOK_URL the bot falls back to long polling.
 
    c) Run the bot:
       python bot.py
@@ -1369,6 +1960,7 @@ DEPLOYMENT GUIDE
    Option A: VPS (DigitalOcean, AWS, GCP)
       - Install Python and dependencies
       - Use systemd service to run bot
+      - Put caddy/nginx in front for TLS and proxy to PORT
       - Setup firewall rules
 
    Option B: Railway/Render (Cloud)
@@ -1396,7 +1988,6 @@ DEPLOYMENT GUIDE
 6. SCALABILITY SUGGESTIONS:
    - Switch to PostgreSQL for production
    - Add Redis for caching
-   - Implement webhook instead of polling
    - Add monitoring (Prometheus/Grafana)
    - Use Docker containers
 """